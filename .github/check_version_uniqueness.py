@@ -1,31 +1,24 @@
 """Make sure that the version number has been increased and does not exist on PyPI yet."""
 
 import importlib.metadata
-import subprocess
+import json
+import urllib.error
+import urllib.request
 
 lib = "interface-proxy"
 
 lib_version = importlib.metadata.version(lib)
 
-not_found = False
-
 try:
-    subprocess.check_call(
-        [  # noqa: S603, S607
-            "python",
-            "-m",
-            "pip",
-            "install",
-            "--no-deps",
-            "--ignore-installed",
-            "--dry-run",
-            f"{lib}=={lib_version}",
-        ],
-    )
-except subprocess.SubprocessError:
-    not_found = True
+    with urllib.request.urlopen(f"https://pypi.org/pypi/{lib}/json", timeout=5) as response:  # noqa: S310
+        releases = json.load(response)["releases"]
+except urllib.error.HTTPError as e:
+    if e.code != 404:  # noqa: PLR2004
+        raise
+    # the package is unknown to PyPI, so any version is new
+    releases = {}
 
-if not_found is False:
+if lib_version in releases:
     exc_msg = (
         f"Version {lib_version} seems to be published already. "
         f"Did you forget to increase the version number in interface_proxy/__init__.py?"
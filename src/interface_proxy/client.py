@@ -7,27 +7,71 @@ convenience class to start and terminate the server process, if it is running on
 from __future__ import annotations
 
 import abc
-import asyncio
-import builtins
 import contextlib
-import json
 import logging
 import os
+import shutil
+import socket
 import subprocess
 import sys
+import tempfile
+import threading
 import time
+import weakref
 from abc import ABC
 from pathlib import Path
-from typing import Any, ClassVar, cast
+from typing import Any, Callable, ClassVar, TypeVar
 
-import pywintypes
-import win32pipe
-import winerror
-from six import reraise
-from tblib import Traceback
+from interface_proxy import codec, shm
+from interface_proxy.endpoints import PORT_FILE_VARIABLE, pipe_socket_path
+from interface_proxy.shm import SharedMemoryChannel
+
+if sys.platform == "win32":
+    import pywintypes
+    import win32file
+    import win32pipe
+    import winerror
+
+try:
+    from tblib import Traceback
+except ImportError:
+    Traceback = None
 
 logger = logging.getLogger("InterfaceProxyClient")
 
+_T = TypeVar("_T")
+
+
+def _retry_while_starting(
+    attempt: Callable[[], _T],
+    errors: tuple[type[Exception], ...],
+    max_timeout: float,
+    *,
+    retry_if: Callable[[Exception], bool] | None = None,
+    first_delay: float = 0.03,
+) -> _T:
+    """Repeat an attempt to reach the server, with increasing delays, as the server process might be starting up.
+
+    Args:
+        attempt: The function that reaches the server.
+        errors: The exceptions that indicate that the server is not ready yet.
+        max_timeout: The maximum delay between two attempts, after which the last exception is raised.
+        retry_if: Decides for an exception of the given types whether it shall be retried. All are retried if None.
+        first_delay: The delay in seconds after the first failed attempt.
+
+    Returns:
+        The result of the first successful attempt.
+    """
+    delay = first_delay
+    while True:
+        try:
+            return attempt()
+        except errors as e:
+            if delay > max_timeout or (retry_if is not None and not retry_if(e)):
+                raise
+        time.sleep(delay)
+        delay *= 1.5
+
 
 class RemoteError(Exception):
     """A generic exception that is raised when the server-side code encountered an exception.
@@ -39,15 +83,28 @@ class RemoteError(Exception):
 
 
 class RemoteVar:
-    """A class that represents an object stored on the server side application, referenced by its name."""
+    """A class that represents an object stored on the server side application, referenced by its name.
+
+    When the RemoteVar is deleted, the server is notified with the next command that it can release the object.
+    """
+
+    # there can be many references, so they shall not carry an instance dict
+    __slots__ = ("_proxy", "variable_reference_name")
 
-    def __init__(self, variable_reference_name: str) -> None:
+    def __init__(self, variable_reference_name: int, proxy: Proxy | None = None) -> None:
         """Create a Reference to an object on the remote side.
 
         Args:
             variable_reference_name: The name of the variable on the server.
+            proxy: The proxy that received the reference and shall notify the server about the release.
         """
         self.variable_reference_name = variable_reference_name
+        self._proxy = proxy
+
+    def __del__(self) -> None:
+        """Let the proxy notify the server that the referenced object is no longer needed."""
+        if self._proxy is not None:
+            self._proxy._released_references.append(self.variable_reference_name)  # noqa: SLF001
 
 
 class RunServer:
@@ -55,12 +112,18 @@ class RunServer:
 
     For one server (specified by exe or py script), always the same RunServer instance is returned.
     At the end, the user must call the release() method to signal that it's safe to kill the server process.
+    A TCP server that listens on port 0 reports the port chosen by the operating system, which is available via the
+    port property.
     """
 
+    MAX_TIMEOUT = 5.0
+
     _instances: ClassVar[dict[str, RunServer]] = {}
     _server_py = None
     _server_exe = None
     _process: subprocess.Popen[bytes] | None = None
+    _port_dir: Path | None = None
+    _port: int | None = None
     _references: set[int]
 
     def __new__(cls, _: object | int, server_exe: Path | None = None, server_py: Path | None = None) -> RunServer:
@@ -73,21 +136,26 @@ class RunServer:
             server_exe: Path to the server as an executable.
             server_py: Path to the server as a python script.
         """
-        obj = cls._instances.get(str(server_exe), None) or cls._instances.get(str(server_py), None)
-        if not obj:
-            obj = super().__new__(cls)
-            obj._references = set()  # noqa: SLF001
-        if cls._instances.get(str(server_exe), obj) != cls._instances.get(str(server_py), obj):
+        # paths that were not given must not be used as key, otherwise they would all share the key "None"
+        key_exe = str(server_exe) if server_exe else None
+        key_py = str(server_py) if server_py else None
+        obj_exe = cls._instances.get(key_exe) if key_exe else None
+        obj_py = cls._instances.get(key_py) if key_py else None
+        if obj_exe and obj_py and obj_exe is not obj_py:
             msg = (
                 "Mismatch between exe and py version. Either the exe does not belong to the py version, or"
                 "RunServer was previously called with different arguments."
             )
             raise ValueError(msg)
+        obj = obj_exe or obj_py
+        if not obj:
+            obj = super().__new__(cls)
+            obj._references = set()  # noqa: SLF001
 
-        if server_exe:
-            cls._instances[str(server_exe)] = obj
-        if server_py:
-            cls._instances[str(server_py)] = obj
+        if key_exe:
+            cls._instances[key_exe] = obj
+        if key_py:
+            cls._instances[key_py] = obj
 
         return obj
 
@@ -166,7 +234,11 @@ class RunServer:
             Path to the python interpreter of the current process, or None if the current interpreter is not python.
         """
         interpreter = Path(sys.executable)
-        if interpreter.name.lower() == "python.exe":
+        if sys.platform == "win32":
+            if interpreter.name.lower() == "python.exe":
+                return interpreter
+        elif interpreter.name.startswith("python"):
+            # e.g. python3 or python3.12
             return interpreter
         return None
 
@@ -195,6 +267,10 @@ class RunServer:
                 self.wait_until_process_stopped(self._process)
             except Exception:
                 logger.exception("Failed to terminate running server process. You may need to restart your PC.")
+        if self._port_dir:
+            shutil.rmtree(self._port_dir, ignore_errors=True)
+            self._port_dir = None
+        self._port = None
 
     def wait_until_process_stopped(self, process: subprocess.Popen[bytes]) -> None:
         """Wait until the terminated process has actually stopped."""
@@ -212,7 +288,7 @@ class RunServer:
         if self._server_exe and self._server_exe.is_file():
             cmd = self.get_exe_command()
             cwd = self._server_exe.parent
-            flags = subprocess.CREATE_NO_WINDOW | subprocess.DETACHED_PROCESS
+            flags = subprocess.CREATE_NO_WINDOW | subprocess.DETACHED_PROCESS if sys.platform == "win32" else 0
             logger.info("Starting exe server")
         elif not self.get_python_interpreter():
             # exe could not be found, and there is no python interpreter to run the py version
@@ -221,13 +297,44 @@ class RunServer:
         elif self._server_py and self._server_py.is_file():
             cmd = self.get_py_command()
             cwd = self._server_py.parent
-            flags = subprocess.CREATE_NEW_CONSOLE
+            flags = subprocess.CREATE_NEW_CONSOLE if sys.platform == "win32" else 0
             logger.info("Starting py server")
         else:
             msg = f"Could not find the server to run, as neither {self._server_exe} nor {self._server_py} exist."
             raise FileNotFoundError(msg)
+        # the server tells the port it is listening on via a file, in case the port was chosen dynamically
+        self._port_dir = Path(tempfile.mkdtemp(prefix="interface-proxy-"))
+        env = {**os.environ, PORT_FILE_VARIABLE: str(self._port_dir / "port")}
         # cmd was constructed from path objects that were valid files
-        self._process = subprocess.Popen(cmd, cwd=cwd, creationflags=flags)  # noqa: S603
+        self._process = subprocess.Popen(cmd, cwd=cwd, creationflags=flags, env=env)  # noqa: S603
+
+    @property
+    def port(self) -> int:
+        """The port on which the TCP server is listening.
+
+        Waits until the server has started listening, if required.
+        """
+        if self._port is not None:
+            return self._port
+        if not self._process or not self._port_dir:
+            msg = "The server has not been started."
+            raise RuntimeError(msg)
+        process = self._process
+        port_file = self._port_dir / "port"
+
+        def read_port() -> int:
+            if process.poll() is not None:
+                msg = "The server process terminated before it reported its port."
+                raise RuntimeError(msg)
+            # the server replaces the file atomically, so it is complete once it exists
+            return int(port_file.read_text())
+
+        try:
+            self._port = _retry_while_starting(read_port, (FileNotFoundError,), self.MAX_TIMEOUT, first_delay=0.01)
+        except FileNotFoundError:
+            msg = "The server did not report its port. Only TCP servers report the port they are listening on."
+            raise TimeoutError(msg) from None
+        return self._port
 
     def release(self, caller: object | int) -> None:
         """Notify the RunServer that the caller no longer needs the server.
@@ -247,10 +354,141 @@ class RunServer:
         self.terminate_server()
 
 
+class BatchResult:
+    """The result of a function call that was queued in a Batch.
+
+    The result is available once the batch has been sent to the server, i.e. after leaving the with block.
+    """
+
+    _done: bool = False
+    _value: object = None
+    _exception: BaseException | None = None
+
+    def set_result(self, value: object) -> None:
+        """Store the return value of the function call.
+
+        Args:
+            value: The value returned by the server.
+        """
+        self._value = value
+        self._done = True
+
+    def set_exception(self, exception: BaseException) -> None:
+        """Store the exception that occurred during the function call.
+
+        Args:
+            exception: The exception that shall be raised when trying to access the result.
+        """
+        self._exception = exception
+        self._done = True
+
+    def result(self) -> Any:  # noqa: ANN401  # any type can be returned from the server
+        """Get the return value of the function call.
+
+        If the function call failed on the server, the exception is raised instead.
+
+        Returns:
+            The value returned by the server.
+        """
+        if not self._done:
+            msg = "The batch has not been sent to the server yet."
+            raise RuntimeError(msg)
+        if self._exception is not None:
+            raise self._exception
+        return self._value
+
+
+class Batch:
+    """A context manager that collects function calls on a Proxy and sends them to the server in a single request.
+
+    Inside the with block, function calls on the proxy return a BatchResult instead of the actual value.
+    All calls are sent to the server when leaving the with block, and executed in the order they were made.
+
+    Example:
+        with Batch(proxy):
+            first = proxy.get_double(1)
+            second = proxy.get_double(2)
+        print(first.result(), second.result())
+    """
+
+    def __init__(self, proxy: object) -> None:
+        """Create a batch for the given proxy.
+
+        Args:
+            proxy: The proxy whose function calls shall be collected. Any type is accepted, so proxies can be
+                annotated with a Protocol that describes the object on the server.
+        """
+        if not isinstance(proxy, Proxy):
+            msg = f"A batch can only be created for a Proxy, not for {type(proxy).__name__}."
+            raise TypeError(msg)
+        self._proxy = proxy
+        self._commands: list[dict[str, Any]] = []
+        self._results: list[BatchResult] = []
+
+    def __enter__(self) -> Batch:
+        """Start collecting the function calls of the proxy."""
+        if self._proxy._batch is not None:  # noqa: SLF001
+            msg = "There is already an active batch for this proxy."
+            raise RuntimeError(msg)
+        self._proxy._batch = self  # noqa: SLF001
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *_: object) -> None:
+        """Stop collecting function calls, and send them to the server, if there was no exception."""
+        self._proxy._batch = None  # noqa: SLF001
+        if exc_type is None:
+            self.send()
+
+    def add(self, command_json: dict[str, Any]) -> BatchResult:
+        """Queue a command for the server.
+
+        Args:
+            command_json: The command as it would be sent to the server on its own.
+
+        Returns:
+            A placeholder for the result that will be filled once the batch has been sent.
+        """
+        result = BatchResult()
+        self._commands.append(command_json)
+        self._results.append(result)
+        return result
+
+    def send(self) -> None:
+        """Send all queued commands to the server in a single request and distribute the responses."""
+        commands, self._commands = self._commands, []
+        results, self._results = self._results, []
+        if not commands:
+            return
+        proxy = self._proxy
+        proxy._add_released_references(commands[0])  # noqa: SLF001
+        command = codec.encode(commands)
+        # the messages shall not be formatted for every request, unless they are actually logged
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"Batch request: {command!r}")
+        response = proxy._send_to_server_binary(command)  # noqa: SLF001
+        if debug:
+            logger.debug(f"Batch response: {response!r}")
+        responses = codec.decode(response)
+        if not isinstance(responses, list):
+            # the batch as a whole failed on the server
+            proxy._unpack_result_json(responses)  # noqa: SLF001
+            msg = "Error decoding the response from the server"
+            raise RuntimeError(msg)  # noqa: TRY004  # consistent with the error for a single response
+        for result, result_json in zip(results, responses):
+            try:
+                unpacked = proxy._unpack_result_json(result_json)  # noqa: SLF001
+                result.set_result(proxy._convert_argument_from_json(unpacked["return"]))  # noqa: SLF001
+            except (RemoteError, RuntimeError) as e:
+                result.set_exception(e)
+
+
 class Proxy(ABC):
     """A class that forwards all attribute and function calls to a server."""
 
     _target_class: str
+    _released_references: list[int]
+    _batch: Batch | None = None
 
     def __init__(self, target_class: str) -> None:
         """Create a proxy object for the specified object.
@@ -259,12 +497,14 @@ class Proxy(ABC):
             target_class: The name by which the server knows the object or module.
         """
         self._target_class = target_class
+        # references to objects on the server that are no longer used and are sent with the next command
+        self._released_references = []
 
     def _convert_argument_from_json(self, arg: Any) -> object:  # noqa: ANN401  # JSON can be complicated
         """Convert a json (loaded) object to an actual python object.
 
         Supports lists, tuples (also treated as lists), dicts, builtin primitives.
-        Objects that were referenced previously, are retrieved by their reference.
+        Primitives are transferred as they are, objects on the server are represented by a RemoteVar.
 
         Args:
             arg: The object after loaded from json.
@@ -272,15 +512,19 @@ class Proxy(ABC):
         Returns:
             The actual python object.
         """
+        # primitives are taken over directly, saving a recursive call for each of them
+        primitive_types = codec.PRIMITIVE_TYPES
         if isinstance(arg, list):
-            return [self._convert_argument_from_json(element) for element in arg]
-        arg_type = arg["type"]
-        arg_value = arg["value"]
-        if arg_type == "RemoteVar":
-            return RemoteVar(arg_value)
-        if arg_type == "NoneType":
-            return None
-        return getattr(builtins, arg_type)(arg_value)
+            return [
+                element if type(element) in primitive_types else self._convert_argument_from_json(element)
+                for element in arg
+            ]
+        if isinstance(arg, dict):
+            return {k: v if type(v) in primitive_types else self._convert_argument_from_json(v) for k, v in arg.items()}
+        reference = codec.decode_reference(arg)
+        if reference is not None:
+            return RemoteVar(reference, self)
+        return arg
 
     def _convert_argument_to_json(self, arg: object) -> Any:  # noqa: ANN401  # JSON can be complicated
         """Convert a python object to a json-serializable object.
@@ -294,59 +538,157 @@ class Proxy(ABC):
         Returns:
             A json-serializable object.
         """
+        # primitives are taken over directly, saving a recursive call for each of them
+        primitive_types = codec.PRIMITIVE_TYPES
+        if type(arg) in primitive_types:
+            return arg
         # tuples become lists in json anyway, so treat them the same here
         if isinstance(arg, (list, tuple)):
-            return [self._convert_argument_to_json(element) for element in arg]
-        arg_type = type(arg).__name__
-        # complex types are not transferred but saved locally and only a reference is sent back
-        if arg_type == "RemoteVar":
-            arg = cast(RemoteVar, arg)
-            arg = arg.variable_reference_name
-        return {
-            "type": arg_type,
-            "value": arg,
-        }
+            return [
+                element if type(element) in primitive_types else self._convert_argument_to_json(element)
+                for element in arg
+            ]
+        if isinstance(arg, dict):
+            return {k: v if type(v) in primitive_types else self._convert_argument_to_json(v) for k, v in arg.items()}
+        # objects on the server are only referenced by their name
+        if isinstance(arg, RemoteVar):
+            return codec.encode_reference(arg.variable_reference_name)
+        return arg
+
+    def _add_released_references(self, command_json: dict[str, Any]) -> None:
+        """Attach the references that are no longer used to the command, so the server can release the objects.
 
-    def _send_to_server(self, command: str) -> str:
-        return self._send_to_server_binary(command.encode("utf-8")).decode("utf-8")
+        Args:
+            command_json: The command that shall be sent to the server next.
+        """
+        if self._released_references:
+            command_json["release"], self._released_references = self._released_references, []
 
     @abc.abstractmethod
     def _send_to_server_binary(self, command: bytes) -> bytes: ...
 
-    def unpack_result(self, response: str) -> Any:  # noqa: ANN401  # JSON can be complicated.
-        """Convert a string from the server to a JSON object.
+    def unpack_result(self, response: bytes) -> Any:  # noqa: ANN401  # JSON can be complicated.
+        """Convert the encoded response from the server to a JSON object.
 
         If there was an exception on the server, a RemoteError is raised with the details of the remote exception.
 
         Args:
-            response: String retrieved from the server.
+            response: Bytes retrieved from the server.
 
         Returns:
             An JSON object representing the response from the server.
         """
-        result = json.loads(response)
-        status = result.get("status", "invalid")
-        if status == "success":
-            return result
-        if status == "exception":
-            message = result["message"]
+        return self._unpack_result_json(codec.decode(response))
 
-            tb = Traceback.from_dict(result["traceback"]).as_traceback()
+    def _unpack_result_json(self, result: Any) -> Any:  # noqa: ANN401  # JSON can be complicated.
+        """Check the status of an already loaded response from the server.
 
-            reraise(
-                RemoteError,
-                RemoteError(f"Server-side processing failed with {message}"),
-                tb,
-            )
+        If there was an exception on the server, a RemoteError is raised with the details of the remote exception.
+
+        Args:
+            result: The response from the server after being loaded from JSON.
+
+        Returns:
+            An JSON object representing the response from the server.
+        """
+        status = result.get("status")
+        if status == codec.STATUS_SUCCESS:
+            return result
+        if status == codec.STATUS_EXCEPTION:
+            message = result["message"]
+            formatted_traceback = "".join(result.get("formatted_traceback", [])).rstrip()
+            error = RemoteError(f"Server-side processing failed with {message}\n\n{formatted_traceback}")
+            if "traceback" in result and Traceback is not None:
+                # the server sent the full traceback, so it can be attached to the exception
+                raise error.with_traceback(Traceback.from_dict(result["traceback"]).as_traceback())
+            raise error from None
 
         msg = "Error decoding the response from the server"
         raise RuntimeError(msg)
 
+    def _create_method(self, function: str) -> Callable[..., Any]:
+        """Create a callable that calls the function on the server.
+
+        While a Batch is active for the proxy, function calls are queued and return a BatchResult instead.
+
+        Args:
+            function: The name of the function on the server.
+
+        Returns:
+            A callable that behaves like the function on the server. It only holds a weak reference to the proxy,
+            as it is stored on the proxy, and a reference cycle would keep the connection of a dropped proxy open.
+        """
+        proxy_ref = weakref.ref(self)
+
+        def handle_call(*args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
+            proxy = proxy_ref()
+            if proxy is None:
+                msg = f"The proxy of the function {function} no longer exists."
+                raise ReferenceError(msg)
+            return proxy._call(function, args, kwargs)  # noqa: SLF001
+
+        return handle_call
+
+    def _call(self, function: str, args: tuple[Any, ...], kwargs: dict[str, Any]) -> Any:  # noqa: ANN401
+        """Call the function on the server, or queue the call while a Batch is active.
+
+        Args:
+            function: The name of the function on the server.
+            args: The positional arguments of the call.
+            kwargs: The keyword arguments of the call.
+
+        Returns:
+            The return value of the function on the server, or a BatchResult while a Batch is active.
+        """
+        command_json = {
+            "class": self._target_class,
+            "function": function,
+            "args": self._convert_argument_to_json(args),
+            "kwargs": self._convert_argument_to_json(kwargs),
+        }
+        if self._batch is not None:
+            # releases are attached when the batch is sent, so they are kept if the batch is discarded
+            return self._batch.add(command_json)
+        self._add_released_references(command_json)
+        command = codec.encode(command_json)
+        # the messages shall not be formatted for every call, unless they are actually logged
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"Request: {command!r}")
+        result = self._send_to_server_binary(command)
+        if debug:
+            logger.debug(f"Response: {result!r}")
+        result_json = self.unpack_result(result)
+        return self._convert_argument_from_json(result_json["return"])
+
+    def _invoke_preencoded(self, function: str, encoded_args: bytes) -> Any:  # noqa: ANN401
+        """Call a function on the server with arguments that were serialized in advance with codec.encode_args().
+
+        This skips converting and serializing the arguments for every call, which is useful for benchmarks of the
+        communication itself. The call cannot be part of a Batch.
+
+        Args:
+            function: The name of the function on the server.
+            encoded_args: The serialized positional arguments.
+
+        Returns:
+            The return value of the function on the server.
+        """
+        if self._batch is not None:
+            msg = "Calls with pre-encoded arguments cannot be queued in a Batch."
+            raise RuntimeError(msg)
+        release, self._released_references = self._released_references, []
+        command = codec.encode_call(self._target_class, function, encoded_args, release)
+        result_json = self.unpack_result(self._send_to_server_binary(command))
+        return self._convert_argument_from_json(result_json["return"])
+
     def __getattr__(self, function: str) -> Any:  # noqa: ANN401
         """Forward all requests to get an attribute to the server.
 
         Attributes that start with an underscore are ignored by this function. Private members should not be accessed
         from the outside, and furthermore this breaks debugging of the Proxy class.
+        Once the server reported an attribute to be callable, the callable is stored on the instance, so further
+        lookups of that attribute neither query the server nor reach this function.
 
         Args:
             function: The name of the attribute to get.
@@ -355,104 +697,646 @@ class Proxy(ABC):
             The value of the requested attribute, or a callable that behaves like the function on the server if
             the attribute is callable on the server.
         """
-
-        def handle_call(*args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
-            args = args or ()
-            kwargs = kwargs or {}
-            command_json = {
-                "class": self._target_class,
-                "function": function,
-                "args": [self._convert_argument_to_json(arg) for arg in args],
-                "kwargs": {k: self._convert_argument_to_json(v) for k, v in kwargs.items()},
-            }
-            command = json.dumps(command_json)
-            logger.debug(f"Request: {command}")
-            result = self._send_to_server(command)
-            logger.debug(f"Response: {result}")
-            result_json = self.unpack_result(result)
-            return self._convert_argument_from_json(result_json["return"])
-
         if function[0] != "_":
             # try to determine if it is an attribute and not a function
             command_json = {
                 "class": self._target_class,
                 "attribute": function,
             }
-            command = json.dumps(command_json)
-            result = self._send_to_server(command)
+            self._add_released_references(command_json)
+            command = codec.encode(command_json)
+            result = self._send_to_server_binary(command)
             result_json = self.unpack_result(result)
-            if result_json["return"]["type"] == "callable":
-                return handle_call
-            logger.debug(f"Request: {command}")
-            logger.debug(f"Response: {result}")
+            if result_json.get("callable", False):
+                method = self._create_method(function)
+                setattr(self, function, method)
+                return method
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Request: {command!r}")
+                logger.debug(f"Response: {result!r}")
             return self._convert_argument_from_json(result_json["return"])
         return None
 
 
-class TCPProxy(Proxy):
-    """Proxy that communicates with a server via TCP sockets."""
+class SocketConnection(ABC):
+    """A persistent connection to a stream socket server, which can be shared by several proxies.
 
-    def __init__(self, target_class: str, address: str, port: int) -> None:
-        """Create a proxy object for the specified object.
+    The connection is opened on first use and reused for all commands. Commands are sent one at a time, as the
+    server answers the commands of a connection in order. Responses are received into a persistent buffer, so a
+    small response only needs a single system call, including its header.
+    """
+
+    MAX_TIMEOUT = 2.0
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self) -> None:
+        """Create a connection to the server, which is opened when the first command is sent."""
+        self._sock: socket.socket | None = None
+        # received data is stored in the buffer between start and end, and may contain the beginning of a frame
+        self._buffer = bytearray(self.BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        # set by subclasses, if quick ACKs shall be used where the socket supports them
+        self._quickack = False
+        # the connection must only be used by one command at a time
+        self._send_lock = threading.Lock()
+
+    def __del__(self) -> None:
+        """Close the connection to the server."""
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection, so the next command will connect again."""
+        if self._sock is not None:
+            with contextlib.suppress(OSError):
+                self._sock.close()
+        self._sock = None
+        self._start = self._end = 0
+
+    @abc.abstractmethod
+    def _open_socket(self) -> socket.socket:
+        """Connect a new socket to the server.
+
+        Returns:
+            The connected socket.
+        """
+
+    def _ensure_conn(self) -> socket.socket:
+        """Open the connection to the server, unless there already is one that can be reused.
+
+        Returns:
+            The connected socket.
+        """
+        if self._sock is not None:
+            return self._sock
+        sock = _retry_while_starting(self._open_socket, (ConnectionRefusedError, FileNotFoundError), self.MAX_TIMEOUT)
+        self._sock = sock
+        return sock
+
+    def _is_usable(self, sock: socket.socket) -> bool:
+        """Check without blocking whether an idle connection can still be used for the next command.
+
+        Args:
+            sock: The connected socket.
+
+        Returns:
+            False if the server closed the connection in the meantime, e.g. because it was restarted.
+        """
+        try:
+            if hasattr(socket, "MSG_DONTWAIT"):
+                sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+            else:
+                # Windows has no flag for a single non-blocking call
+                sock.setblocking(False)
+                try:
+                    sock.recv(1, socket.MSG_PEEK)
+                finally:
+                    sock.setblocking(True)
+        except BlockingIOError:
+            # nothing to receive, as expected for an idle connection
+            return True
+        except OSError:
+            return False
+        # the server either closed the connection, or sent data that does not belong to any command
+        return False
+
+    def _recv_into(self, sock: socket.socket, view: memoryview) -> int:
+        """Receive data from the socket into the given memory.
+
+        Args:
+            sock: The connected socket.
+            view: The memory where the received data shall be written.
+
+        Returns:
+            The number of received bytes.
+        """
+        received = sock.recv_into(view)
+        if not received:
+            msg = "The server closed the connection without sending a complete response."
+            raise ConnectionError(msg)
+        if self._quickack and hasattr(socket, "TCP_QUICKACK"):
+            # Linux only, and it resets the quick ACK mode after every read
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        return received
+
+    def _read(self, sock: socket.socket, size: int) -> bytes:
+        """Take the given number of bytes from the receive buffer, and receive more data if required.
+
+        Args:
+            sock: The connected socket.
+            size: The number of bytes to read.
+
+        Returns:
+            The requested bytes.
+        """
+        available = self._end - self._start
+        if available < size:
+            if size > self.BUFFER_SIZE:
+                # receive large payloads directly into their own memory
+                payload = bytearray(size)
+                payload[:available] = self._view[self._start : self._end]
+                view = memoryview(payload)
+                while available < size:
+                    available += self._recv_into(sock, view[available:])
+                self._start = self._end = 0
+                return bytes(payload)
+            # move the beginning of the frame to the front, so the remaining buffer can be filled
+            self._buffer[:available] = bytes(self._view[self._start : self._end])
+            self._start = 0
+            self._end = available
+            while self._end < size:
+                self._end += self._recv_into(sock, self._view[self._end :])
+        data = bytes(self._view[self._start : self._start + size])
+        self._start += size
+        return data
+
+    def _send_frame(self, sock: socket.socket, command: bytes) -> None:
+        """Send the command with its frame header, without copying the command to prepend the header.
+
+        Args:
+            sock: The connected socket.
+            command: The encoded command.
+        """
+        if sys.platform == "win32":
+            # sendmsg is not available on Windows
+            sock.sendall(codec.frame(command))
+            return
+        header = codec.frame_header(command)
+        sent = sock.sendmsg((header, command))
+        # the operating system may not accept all data at once for large commands
+        if sent < len(header):
+            sock.sendall(header[sent:])
+            sock.sendall(command)
+        elif sent < len(header) + len(command):
+            sock.sendall(memoryview(command)[sent - len(header) :])
+
+    def send(self, command: bytes) -> bytes:
+        """Send a command to the server and wait for the response.
+
+        Args:
+            command: The encoded command.
+
+        Returns:
+            The encoded response from the server.
+
+        Raises:
+            ValueError: The command is larger than the server accepts.
+        """
+        # an oversized command is rejected before it is sent, so the connection stays usable
+        codec.check_message_size(command)
+        with self._send_lock:
+            reused = self._sock is not None and self._is_usable(self._sock)
+            if not reused:
+                self.close()
+            sock = self._ensure_conn()
+            try:
+                try:
+                    self._send_frame(sock, command)
+                except (BrokenPipeError, ConnectionResetError):
+                    if not reused:
+                        raise
+                    # the server closed the idle connection before it received the command, so send it again
+                    self.close()
+                    sock = self._ensure_conn()
+                    self._send_frame(sock, command)
+                header = self._read(sock, codec.HEADER_SIZE)
+                return self._read(sock, codec.frame_length(header))
+            except BaseException:
+                # the connection is broken or out of sync, or the call was interrupted and its response would be
+                # returned for the next call, so drop the connection and reconnect on the next call
+                self.close()
+                raise
+
+
+class TCPConnection(SocketConnection):
+    """A persistent connection to a TCP server, which can be shared by several TCPProxy instances."""
+
+    def __init__(self, address: str, port: int, *, nodelay: bool = True) -> None:
+        """Create a connection to the server, which is opened when the first command is sent.
 
         Args:
-            target_class: The name by which the server knows the object or module.
             address: The IP address of the server.
             port: The port number where the server can be reached.
+            nodelay: Send each command immediately and acknowledge responses without delay, for the lowest latency.
+                Set to False to let the operating system combine small packets (Nagle's algorithm) instead.
         """
-        super().__init__(target_class)
-        self.loop = asyncio.new_event_loop()
-        self._target_class = target_class
+        super().__init__()
         self.address = address
         self.port = port
+        self.nodelay = nodelay
+        self._quickack = nodelay
+
+    def _open_socket(self) -> socket.socket:
+        sock = socket.create_connection((self.address, self.port))
+        if self.nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # the persistent connection shall detect dead servers, and large commands shall fit into the buffer
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+        return sock
+
+
+class UnixSocketConnection(SocketConnection):
+    """A persistent connection to a Unix domain socket server, which can be shared by several UnixSocketProxy."""
+
+    def __init__(self, path: str) -> None:
+        """Create a connection to the server, which is opened when the first command is sent.
+
+        Args:
+            path: The file system path of the socket on which the server is listening.
+        """
+        super().__init__()
+        self.path = path
+
+    def _open_socket(self) -> socket.socket:
+        if sys.platform == "win32":
+            msg = "Unix domain sockets are not supported on Windows, use named pipes instead."
+            raise RuntimeError(msg)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+        return sock
+
+
+class SharedMemoryConnection:
+    """A connection to a server via shared memory, which can be shared by several ShmProxy instances.
+
+    The shared memory is attached on first use. Commands are sent one at a time, and only a single client process
+    can use the shared memory of a server.
+    """
+
+    MAX_TIMEOUT = 2.0
+    TIMEOUT = 60.0
+
+    def __init__(self, name: str, *, timeout: float | None = TIMEOUT) -> None:
+        """Create a connection to the server, which is attached when the first command is sent.
+
+        Args:
+            name: The name of the shared memory created by the server.
+            timeout: Maximum time in seconds to wait for a response, or None to wait forever. As a killed server
+                cannot be noticed via shared memory, the timeout ends the wait for a server that stopped.
+        """
+        self.name = name
+        self.timeout = timeout
+        self._channel: SharedMemoryChannel | None = None
+        self._sequence = 0
+        # the shared memory must only be used by one command at a time
+        self._send_lock = threading.Lock()
 
     def __del__(self) -> None:
-        """Clean up the asyncio loop that was used for communicating with the server asynchronously."""
-        self.loop.close()
+        """Detach from the shared memory."""
+        self._close()
 
-    async def _async_send_to_server(self, command: bytes) -> bytes:
-        reader, writer = await asyncio.open_connection(self.address, self.port)
+    def _close(self) -> None:
+        """Detach from the shared memory, so it is attached again for the next command."""
+        if self._channel is not None:
+            with contextlib.suppress(BufferError):
+                self._channel.close()
+            self._channel = None
 
-        writer.write(command + b"\n")
-        await writer.drain()
+    def _ensure_channel(self) -> SharedMemoryChannel:
+        """Attach the shared memory of the server, unless it already is attached.
 
-        data = await reader.readline()
+        Returns:
+            The attached channel.
+        """
+        if self._channel is not None:
+            return self._channel
+        channel = _retry_while_starting(
+            lambda: SharedMemoryChannel(self.name),
+            (FileNotFoundError,),
+            self.MAX_TIMEOUT,
+        )
+        # continue with the sequence numbers of the previous client
+        self._sequence = channel.sequence(shm.REQUEST_AREA)
+        self._channel = channel
+        return channel
+
+    def send(self, command: bytes) -> bytes:
+        """Send a command to the server and wait for the response.
 
-        writer.close()
-        return data
+        Args:
+            command: The encoded command.
+
+        Returns:
+            The encoded response from the server.
+
+        Raises:
+            ValueError: The command is larger than the capacity of the shared memory.
+        """
+        codec.check_message_size(command)
+        with self._send_lock:
+            try:
+                return self._send(self._ensure_channel(), command)
+            except BaseException:
+                # after a timeout or an interruption, the server of the next command might have been restarted
+                self._close()
+                raise
+
+    def _send(self, channel: SharedMemoryChannel, command: bytes) -> bytes:
+        """Write the command and wait for its response.
+
+        Args:
+            channel: The attached channel.
+            command: The encoded command.
+
+        Returns:
+            The encoded response from the server.
+        """
+        previous = channel.sequence(shm.RESPONSE_AREA)
+        self._sequence += 1
+        channel.write(shm.REQUEST_AREA, command, self._sequence)
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        while True:
+            timeout = None if deadline is None else max(deadline - time.perf_counter(), 0.0)
+            previous = channel.wait(shm.RESPONSE_AREA, previous, timeout)
+            if previous == self._sequence:
+                return channel.read(shm.RESPONSE_AREA)
+            # late response to a command that was given up on, the server handles the new one next
+
+
+# connections that are shared by the proxies of a process, by the location of the server
+_tcp_connections: dict[tuple[str, int], TCPConnection] = {}
+_unix_connections: dict[str, UnixSocketConnection] = {}
+_shm_connections: dict[str, SharedMemoryConnection] = {}
+_connections_lock = threading.Lock()
+
+
+def connect_tcp(address: str, port: int, *, nodelay: bool = True) -> TCPConnection:
+    """Get the shared connection to the TCP server at the given address and port.
+
+    The connection is created on the first request for an address and port, and subsequently reused.
+
+    Args:
+        address: The IP address of the server.
+        port: The port number where the server can be reached.
+        nodelay: Optimize the connection for latency instead of throughput, see TCPConnection.
+            Only used when the connection is created.
+
+    Returns:
+        The connection that can be passed to the TCPProxy constructor.
+    """
+    with _connections_lock:
+        conn = _tcp_connections.get((address, port))
+        if conn is None:
+            conn = _tcp_connections[address, port] = TCPConnection(address, port, nodelay=nodelay)
+        return conn
+
+
+def connect_unix(path: str) -> UnixSocketConnection:
+    """Get the shared connection to the Unix domain socket server listening on the given path.
+
+    The connection is created on the first request for a path, and subsequently reused.
+
+    Args:
+        path: The file system path of the socket on which the server is listening.
+
+    Returns:
+        The connection that can be passed to the UnixSocketProxy constructor.
+    """
+    with _connections_lock:
+        conn = _unix_connections.get(path)
+        if conn is None:
+            conn = _unix_connections[path] = UnixSocketConnection(path)
+        return conn
+
+
+def connect_shm(name: str, *, timeout: float | None = SharedMemoryConnection.TIMEOUT) -> SharedMemoryConnection:
+    """Get the shared connection to the server with the given shared memory name.
+
+    The connection is created on the first request for a name, and subsequently reused.
+
+    Args:
+        name: The name of the shared memory created by the server.
+        timeout: Maximum time in seconds to wait for a response, or None to wait forever.
+            Only used when the connection is created.
+
+    Returns:
+        The connection that can be passed to the ShmProxy constructor.
+    """
+    with _connections_lock:
+        conn = _shm_connections.get(name)
+        if conn is None:
+            conn = _shm_connections[name] = SharedMemoryConnection(name, timeout=timeout)
+        return conn
+
+
+class TCPProxy(Proxy):
+    """Proxy that communicates with a server via TCP sockets.
+
+    By default, each proxy has its own connection. Proxies for different objects on the same server can share a
+    single connection, by passing the connection returned from connect_tcp().
+    """
+
+    def __init__(  # noqa: PLR0913  # keyword-only connection options
+        self,
+        target_class: str,
+        address: str | None = None,
+        port: int | None = None,
+        *,
+        conn: TCPConnection | None = None,
+        nodelay: bool = True,
+    ) -> None:
+        """Create a proxy object for the specified object.
+
+        Args:
+            target_class: The name by which the server knows the object or module.
+            address: The IP address of the server. Required if no connection is given.
+            port: The port number where the server can be reached. Required if no connection is given.
+            conn: An existing connection to the server that shall be used.
+            nodelay: Optimize the new connection for latency instead of throughput, see TCPConnection.
+                Not used if a connection is given.
+        """
+        super().__init__(target_class)
+        self._target_class = target_class
+        if conn is None:
+            if address is None or port is None:
+                msg = "Either a connection, or the address and port of the server must be given."
+                raise ValueError(msg)
+            conn = TCPConnection(address, port, nodelay=nodelay)
+        self._conn = conn
+        self.address = conn.address
+        self.port = conn.port
 
     def _send_to_server_binary(self, command: bytes) -> bytes:
-        return self.loop.run_until_complete(self._async_send_to_server(command))
+        return self._conn.send(command)
+
+
+class UnixSocketProxy(Proxy):
+    """Proxy that communicates with a server via Unix domain sockets.
+
+    Unix domain sockets are only available if client and server run on the same machine, and avoid the overhead of
+    the TCP stack. They are not supported on Windows, where the PipeProxy can be used instead.
+    Proxies for different objects on the same server can share a single connection, by passing the connection
+    returned from connect_unix().
+    """
+
+    def __init__(self, target_class: str, path: str | None = None, *, conn: UnixSocketConnection | None = None) -> None:
+        """Create a proxy object for the specified object.
+
+        Args:
+            target_class: The name by which the server knows the object or module.
+            path: The file system path of the socket on which the server is listening. Required if no connection is
+                given.
+            conn: An existing connection to the server that shall be used.
+        """
+        super().__init__(target_class)
+        self._target_class = target_class
+        if conn is None:
+            if path is None:
+                msg = "Either a connection, or the path of the server socket must be given."
+                raise ValueError(msg)
+            conn = UnixSocketConnection(path)
+        self._conn = conn
+
+    def _send_to_server_binary(self, command: bytes) -> bytes:
+        return self._conn.send(command)
+
+
+class ShmProxy(Proxy):
+    """Proxy that communicates with a server on the same machine via shared memory.
+
+    This avoids system calls altogether, at the cost of polling for responses. As only a single client can use the
+    shared memory of a server, all proxies of a process must share the connection returned from connect_shm().
+    """
+
+    def __init__(
+        self,
+        target_class: str,
+        name: str | None = None,
+        *,
+        conn: SharedMemoryConnection | None = None,
+    ) -> None:
+        """Create a proxy object for the specified object.
+
+        Args:
+            target_class: The name by which the server knows the object or module.
+            name: The name of the shared memory created by the server. If given, the shared connection for this name
+                is used.
+            conn: An existing connection to the server that shall be used.
+        """
+        super().__init__(target_class)
+        self._target_class = target_class
+        if conn is None:
+            if name is None:
+                msg = "Either a connection, or the name of the shared memory must be given."
+                raise ValueError(msg)
+            conn = connect_shm(name)
+        self._conn = conn
+
+    def _send_to_server_binary(self, command: bytes) -> bytes:
+        return self._conn.send(command)
 
 
 class PipeProxy(Proxy):
-    """Proxy that communicates with a server via TCP sockets."""
+    """Proxy that communicates with a server via named pipes.
+
+    The pipe is opened once and the handle is reused for all commands. Named pipes are only available on Windows,
+    on other operating systems a Unix domain socket named after the pipe is used instead.
+    """
 
     MAX_TIMEOUT = 2.0
 
-    def __init__(self, target_class: str, pipe_name: str) -> None:
+    def __init__(self, target_class: str, pipe_name: str, *, use_abstract: bool = sys.platform == "linux") -> None:
         """Create a proxy object for the specified object.
 
         Args:
             target_class: The name by which the server knows the object or module.
             pipe_name: The name of the pipe to communicate with the server.
+            use_abstract: Connect to the Unix domain socket in the abstract namespace, which must match the setting of
+                the server. Only supported on Linux, where it is the default. Not used on Windows.
         """
         super().__init__(target_class)
         self._target_class = target_class
         self.pipe_name = rf"\\.\PIPE\{pipe_name}"
+        self._handle: Any = None
+        self._conn: UnixSocketConnection | None = None
+        if sys.platform != "win32":
+            self._conn = UnixSocketConnection(pipe_socket_path(pipe_name, use_abstract=use_abstract))
+        # the pipe handle must only be used by one command at a time
+        self._send_lock = threading.Lock()
+
+    def __del__(self) -> None:
+        """Close the handle of the pipe."""
+        self._close_handle()
+
+    def _close_handle(self) -> None:
+        """Close the handle of the pipe, so the next command will open the pipe again."""
+        if self._handle is not None:
+            with contextlib.suppress(pywintypes.error):
+                win32file.CloseHandle(self._handle)
+            self._handle = None
+
+    def _ensure_handle(self) -> Any:  # noqa: ANN401  # PyHANDLE is not available at runtime
+        """Open the pipe in message mode, unless there already is an open handle that can be reused.
+
+        Returns:
+            The handle of the pipe.
+        """
+        if self._handle is not None:
+            return self._handle
+
+        def open_pipe() -> Any:  # noqa: ANN401  # PyHANDLE is not available at runtime
+            return win32file.CreateFile(
+                self.pipe_name,
+                win32file.GENERIC_READ | win32file.GENERIC_WRITE,
+                0,
+                None,
+                win32file.OPEN_EXISTING,
+                0,
+                None,
+            )
+
+        def is_not_ready(e: Exception) -> bool:
+            # besides not existing yet, all instances of the pipe might be busy currently
+            return getattr(e, "winerror", None) in (winerror.ERROR_FILE_NOT_FOUND, winerror.ERROR_PIPE_BUSY)
+
+        handle = _retry_while_starting(open_pipe, (pywintypes.error,), self.MAX_TIMEOUT, retry_if=is_not_ready)
+        win32pipe.SetNamedPipeHandleState(handle, win32pipe.PIPE_READMODE_MESSAGE, None, None)
+        self._handle = handle
+        return handle
+
+    def _transact(self, command: bytes) -> bytes:
+        """Write the command to the pipe and read the complete response message.
+
+        Args:
+            command: The command to send to the server.
+
+        Returns:
+            The response from the server.
+        """
+        handle = self._ensure_handle()
+        hr: int
+        data: bytes
+        hr, data = win32pipe.TransactNamedPipe(handle, codec.frame(command), 2**16, None)  # type: ignore
+        # keep reading while the message is incomplete, or the frame did not fit into a single message
+        while hr == winerror.ERROR_MORE_DATA or len(data) < codec.HEADER_SIZE + codec.frame_length(data):
+            hr, chunk = win32file.ReadFile(handle, 2**16)
+            data += chunk
+        return data[codec.HEADER_SIZE :]
 
     def _send_to_server_binary(self, command: bytes) -> bytes:
-        delay = 0.03
-        while True:
+        if self._conn is not None:
+            return self._conn.send(command)
+        with self._send_lock:
             try:
-                return win32pipe.CallNamedPipe(self.pipe_name, command + b"\n", 2**16, 5000)  # type: ignore
-
+                return self._transact(command)
             except pywintypes.error as e:
-                # server process might be starting up currently or the previous one was shutdown recently and
-                # the new one still has to be started
-                if e.winerror not in [winerror.ERROR_FILE_NOT_FOUND, winerror.ERROR_BROKEN_PIPE]:
+                self._close_handle()
+                # the previous server was shutdown and the handle became invalid, so try again with a new handle
+                if e.winerror not in [winerror.ERROR_BROKEN_PIPE, winerror.ERROR_NO_DATA]:
                     raise
-                if delay > self.MAX_TIMEOUT:
-                    raise
-                time.sleep(delay)
-                delay *= 1.5
+            except BaseException:
+                # the response of an interrupted call would be returned for the next call, so drop the handle
+                self._close_handle()
+                raise
+            try:
+                return self._transact(command)
+            except BaseException:
+                self._close_handle()
+                raise
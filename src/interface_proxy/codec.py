@@ -0,0 +1,250 @@
+"""Encoding and decoding of the commands and responses that are exchanged between client and server.
+
+Messages are serialized with MessagePack, where references to objects on the server and integers that do not fit into 64
+bits are sent as extension types, and fixed values like the status of a response are small integers. Each message is
+sent as a frame, consisting of the length of the payload as 4 byte big-endian integer, followed by the payload itself.
+
+Only plain data can be deserialized, so in contrast to pickle, a message can never execute code on the receiving
+side. The size of a message is limited, so a corrupt or malicious header cannot exhaust the memory.
+"""
+
+from __future__ import annotations
+
+import struct
+import threading
+from typing import Any, cast
+
+import msgpack
+
+PRIMITIVE_TYPES = frozenset((int, float, str, bool, bytes, type(None)))
+"""Types that are transferred as they are, and not as a reference to an object on the server."""
+
+STATUS_SUCCESS = 0
+"""Status of the response to a command that was executed successfully."""
+
+STATUS_EXCEPTION = 1
+"""Status of the response to a command that raised an exception on the server."""
+
+EXT_REFERENCE = 1
+"""MessagePack extension type code of a reference to an object on the server."""
+
+REFERENCE_SIZE = 8
+"""Number of bytes of the reference name in the extension type."""
+
+EXT_BIG_INT = 2
+"""MessagePack extension type code of an integer that does not fit into 64 bits, as signed big-endian bytes."""
+
+REFERENCE_NONCE_BITS = 32
+"""Number of leading bits of a reference name that are chosen randomly by each server process."""
+
+_thread_local = threading.local()
+"""Holds one reusable Packer per thread, as creating a Packer for every message is expensive."""
+
+_header = struct.Struct(">I")
+"""Precompiled format of the frame header, which is faster than converting the length via int methods."""
+
+HEADER_SIZE = _header.size
+"""Number of bytes of the frame header, which contains the length of the payload."""
+
+MAX_MESSAGE_SIZE = 16 << 20
+"""Maximum number of bytes of a payload, which is checked before sending and when receiving."""
+
+
+def _encode_extension(obj: object) -> msgpack.ExtType:
+    """Serialize objects that MessagePack does not support natively, which is called by the Packer.
+
+    Args:
+        obj: The object that could not be serialized.
+
+    Returns:
+        The extension type that represents the object.
+
+    Raises:
+        TypeError: The object cannot be serialized.
+    """
+    if isinstance(obj, int):
+        return msgpack.ExtType(EXT_BIG_INT, obj.to_bytes(obj.bit_length() // 8 + 1, "big", signed=True))
+    msg = f"Cannot serialize an object of type {type(obj).__name__}."
+    raise TypeError(msg)
+
+
+def _decode_extension(code: int, data: bytes) -> object:
+    """Deserialize the extension types that are not handled by the receiver itself, which is called by unpackb.
+
+    Args:
+        code: The extension type code.
+        data: The payload of the extension type.
+
+    Returns:
+        The deserialized object, or the extension type itself, like references that are resolved by the receiver.
+    """
+    if code == EXT_BIG_INT:
+        return int.from_bytes(data, "big", signed=True)
+    return msgpack.ExtType(code, data)
+
+
+def _packer() -> msgpack.Packer:
+    """Get the Packer of the current thread.
+
+    Returns:
+        A Packer that can be used for a message.
+    """
+    packer = getattr(_thread_local, "packer", None)
+    if packer is None:
+        packer = _thread_local.packer = msgpack.Packer(use_bin_type=True, default=_encode_extension)
+    return cast(msgpack.Packer, packer)
+
+
+def encode(obj: Any) -> bytes:  # noqa: ANN401  # messages can be complicated
+    """Serialize an object to MessagePack.
+
+    Args:
+        obj: The object consisting of lists, dicts, and primitives.
+
+    Returns:
+        The MessagePack representation of the object.
+    """
+    return cast(bytes, _packer().pack(obj))
+
+
+def encode_args(*args: Any) -> bytes:
+    """Serialize the positional arguments of a function call once, so they can be sent any number of times.
+
+    Args:
+        args: The arguments consisting of lists, dicts, primitives, and encoded references.
+
+    Returns:
+        The MessagePack representation of the arguments, which can be passed to encode_call().
+    """
+    return encode(list(args))
+
+
+def encode_call(target_class: str, function: str, encoded_args: bytes, release: list[int] | None = None) -> bytes:
+    """Serialize a function call command, where the arguments were already serialized with encode_args().
+
+    Args:
+        target_class: The name by which the server knows the object or module.
+        function: The name of the function to call.
+        encoded_args: The serialized positional arguments.
+        release: References that are no longer used and can be released by the server.
+
+    Returns:
+        The MessagePack representation of the command.
+    """
+    packer = _packer()
+    parts = [
+        packer.pack_map_header(5 if release else 4),
+        packer.pack("class"),
+        packer.pack(target_class),
+        packer.pack("function"),
+        packer.pack(function),
+        packer.pack("args"),
+        encoded_args,
+        packer.pack("kwargs"),
+        packer.pack({}),
+    ]
+    if release:
+        parts += [packer.pack("release"), packer.pack(release)]
+    return b"".join(parts)
+
+
+def decode(data: bytes) -> Any:  # noqa: ANN401  # messages can be complicated
+    """Deserialize an object from MessagePack.
+
+    Args:
+        data: The MessagePack representation of an object.
+
+    Returns:
+        The deserialized object.
+    """
+    return msgpack.unpackb(data, raw=False, strict_map_key=False, ext_hook=_decode_extension)
+
+
+def encode_reference(name: int) -> msgpack.ExtType:
+    """Create the representation of a reference to an object on the server.
+
+    Args:
+        name: The name by which the server knows the object.
+
+    Returns:
+        The extension type that can be serialized as part of a message.
+    """
+    return msgpack.ExtType(EXT_REFERENCE, name.to_bytes(REFERENCE_SIZE, "big"))
+
+
+def decode_reference(obj: object) -> int | None:
+    """Get the name of the referenced object, if the deserialized object is a reference.
+
+    Args:
+        obj: Any part of a deserialized message.
+
+    Returns:
+        The name by which the server knows the object, or None if the object is not a reference.
+    """
+    if isinstance(obj, msgpack.ExtType) and obj.code == EXT_REFERENCE:
+        return int.from_bytes(obj.data, "big")
+    return None
+
+
+def check_message_size(payload: bytes) -> None:
+    """Check that the other side accepts the message, before anything of it is sent.
+
+    Args:
+        payload: The encoded message.
+
+    Raises:
+        ValueError: The message is larger than MAX_MESSAGE_SIZE.
+    """
+    if len(payload) > MAX_MESSAGE_SIZE:
+        msg = f"Message of {len(payload)} bytes exceeds the maximum size of {MAX_MESSAGE_SIZE} bytes."
+        raise ValueError(msg)
+
+
+def frame_header(payload: bytes) -> bytes:
+    """Create the header of the frame for the payload, for sending header and payload without joining them.
+
+    Args:
+        payload: The encoded message.
+
+    Returns:
+        The header that must be sent directly before the payload.
+
+    Raises:
+        ValueError: The message is larger than MAX_MESSAGE_SIZE.
+    """
+    check_message_size(payload)
+    return _header.pack(len(payload))
+
+
+def frame(payload: bytes) -> bytes:
+    """Prefix the payload with its length, so the receiver knows how many bytes to read.
+
+    Args:
+        payload: The encoded message.
+
+    Returns:
+        The frame that can be sent to the other side.
+
+    Raises:
+        ValueError: The message is larger than MAX_MESSAGE_SIZE.
+    """
+    return frame_header(payload) + payload
+
+
+def frame_length(header: bytes) -> int:
+    """Get the length of the payload from the frame header.
+
+    Args:
+        header: The header of the frame, which must be complete. Any data after the header is ignored.
+
+    Returns:
+        The number of bytes of the payload that follows the header.
+
+    Raises:
+        ValueError: The payload would be larger than MAX_MESSAGE_SIZE.
+    """
+    length = cast(int, _header.unpack_from(header)[0])
+    if length > MAX_MESSAGE_SIZE:
+        msg = f"Message of {length} bytes exceeds the maximum size of {MAX_MESSAGE_SIZE} bytes."
+        raise ValueError(msg)
+    return length
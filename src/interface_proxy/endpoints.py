@@ -0,0 +1,24 @@
+"""Locations of the server that client and server must agree on, without the client importing the server module."""
+
+from __future__ import annotations
+
+import tempfile
+from pathlib import Path
+
+PORT_FILE_VARIABLE = "INTERFACE_PROXY_PORT_FILE"
+"""Environment variable with a path, where the TCP server writes the port it is listening on."""
+
+
+def pipe_socket_path(pipe_name: str, *, use_abstract: bool) -> str:
+    """Get the address of the Unix domain socket that is used instead of a named pipe outside of Windows.
+
+    Args:
+        pipe_name: The name of the pipe.
+        use_abstract: Use the abstract namespace of Linux, which needs no socket file that could be left behind.
+
+    Returns:
+        The address that server and client use for the socket.
+    """
+    if use_abstract:
+        return f"\0{pipe_name}"
+    return str(Path(tempfile.gettempdir()) / pipe_name)
@@ -3,37 +3,60 @@
 from __future__ import annotations
 
 import asyncio
-import builtins
-import json
+import contextlib
+import importlib
 import logging
+import os
+import secrets
+import signal
+import socket
 import sys
 import traceback
-from typing import Any, cast
+from pathlib import Path
+from typing import Any, Callable, cast
 
-from tblib import Traceback
+from interface_proxy import codec, shm
+from interface_proxy.endpoints import PORT_FILE_VARIABLE, pipe_socket_path
+from interface_proxy.shm import SharedMemoryChannel
+
+try:
+    from tblib import Traceback
+except ImportError:
+    Traceback = None
 
 
 class Server:
     """This class parses commands, runs them on the target modules, and returns the results.
 
-    Commands and results are communicated in a json structure. Objects will not be transferred, but
+    Commands and results are communicated in a MessagePack structure. Objects will not be transferred, but
     instead stored locally and only a reference is transferred, which from there on can be used in
-    function arguments.
+    function arguments. When the client no longer uses a reference, it tells the server to release the object.
     """
 
     _target_classes: dict[str, object]
-    _local_variables: dict[str, Any]
+    _local_variables: dict[int, Any]
     _local_variable_count: int
+    _method_cache: dict[tuple[str, str], Callable[..., Any]]
 
-    def __init__(self, served_objects: dict[str, Any]) -> None:
+    def __init__(self, served_objects: dict[str, Any], *, full_traceback: bool = False) -> None:
         """Initialize the server and specify the objects that shall be available in commands.
 
         Args:
             served_objects: Dictionary mapping from names to objects that shall be available over the proxy.
+            full_traceback: Send the traceback of exceptions in a form that allows the client to rebuild the
+                traceback object. Requires tblib.
         """
+        if full_traceback and Traceback is None:
+            msg = "Sending the full traceback requires tblib to be installed."
+            raise RuntimeError(msg)
+        self._full_traceback = full_traceback
         self._target_classes = served_objects
-        self._local_variable_count = 0
+        # references start at a random offset, so outdated references of a previous server process do not match
+        nonce_shift = 8 * codec.REFERENCE_SIZE - codec.REFERENCE_NONCE_BITS
+        self._local_variable_count = secrets.randbits(codec.REFERENCE_NONCE_BITS) << nonce_shift
         self._local_variables = {}
+        # served objects are not expected to change their functions, so they only need to be looked up once
+        self._method_cache = {}
 
     def return_target(self, target_class: str) -> object:
         """Obtain the target class from the name.
@@ -50,7 +73,8 @@ class Server:
         """Convert a json (loaded) object to an actual python object.
 
         Supports lists, tuples (also treated as lists), dicts, builtin primitives.
-        Objects that were referenced previously, are retrieved by their reference.
+        Primitives are transferred as they are. Objects that were referenced previously, are retrieved by their
+        reference.
 
         Args:
             arg: The object after loaded from json.
@@ -58,15 +82,19 @@ class Server:
         Returns:
             The actual python object.
         """
+        # primitives are taken over directly, saving a recursive call for each of them
+        primitive_types = codec.PRIMITIVE_TYPES
         if isinstance(arg, list):
-            return [self.convert_argument_from_json(element) for element in arg]
-        arg_type = arg["type"]
-        arg_value = arg["value"]
-        if arg_type == "RemoteVar":
-            return self._local_variables[str(arg_value)]
-        if arg_type == "NoneType":
-            return None
-        return getattr(builtins, arg_type)(arg_value)
+            return [
+                element if type(element) in primitive_types else self.convert_argument_from_json(element)
+                for element in arg
+            ]
+        if isinstance(arg, dict):
+            return {k: v if type(v) in primitive_types else self.convert_argument_from_json(v) for k, v in arg.items()}
+        reference = codec.decode_reference(arg)
+        if reference is not None:
+            return self._local_variables[reference]
+        return arg
 
     def convert_argument_to_json(self, arg: object) -> Any:  # noqa: ANN401  # JSON can be complicated
         """Convert a python object to a json-serializable object.
@@ -80,141 +108,298 @@ class Server:
         Returns:
             A json-serializable object.
         """
+        # primitives are taken over directly, saving a recursive call for each of them
+        primitive_types = codec.PRIMITIVE_TYPES
+        if type(arg) in primitive_types:
+            return arg
         # tuples become lists in json anyway, so treat them the same here
         if isinstance(arg, (list, tuple)):
-            return [self.convert_argument_to_json(element) for element in arg]
-        arg_type = type(arg).__name__
+            return [
+                element if type(element) in primitive_types else self.convert_argument_to_json(element)
+                for element in arg
+            ]
+        if isinstance(arg, dict):
+            return {k: v if type(v) in primitive_types else self.convert_argument_to_json(v) for k, v in arg.items()}
         # complex types are not transferred but saved locally and only a reference is sent back
-        if not hasattr(builtins, arg_type) and arg_type != "NoneType":
-            self._local_variable_count += 1
-            self._local_variables[str(self._local_variable_count)] = arg
-            arg_type = "RemoteVar"
-            arg = str(self._local_variable_count)
-        return {
-            "type": arg_type,
-            "value": arg,
-        }
+        self._local_variable_count += 1
+        self._local_variables[self._local_variable_count] = arg
+        return codec.encode_reference(self._local_variable_count)
 
-    def run_command(self, command: str) -> str:
-        """Run a command that is encoded in a JSON format.
+    def release_references(self, references: list[int]) -> None:
+        """Forget objects that are no longer referenced by the client.
+
+        Args:
+            references: The names of the references that the client released.
+        """
+        for reference in references:
+            self._local_variables.pop(reference, None)
+
+    def run_command(self, command: bytes) -> bytes:
+        """Run a command that is encoded in MessagePack format.
 
         If the command does not reference a function, the attribute value is returned instead.
+        If a list of commands is sent, they are all executed in order and a list of responses is returned.
 
         Args:
-            command: JSON representation of the command.
+            command: MessagePack representation of the command.
 
         Returns:
             Return value of the executed command.
         """
-        command_json = json.loads(command)
+        command_json = codec.decode(command)
+        if isinstance(command_json, list):
+            return codec.encode([self.run_batched_command(single_command) for single_command in command_json])
+        return codec.encode(self._run_command_json(command_json))
+
+    def run_batched_command(self, command_json: dict[str, Any]) -> dict[str, Any]:
+        """Run a single command of a batch.
+
+        Exceptions are not raised, but returned as the response of this command, so the remaining commands of
+        the batch are still executed.
+
+        Args:
+            command_json: The command after being loaded from JSON.
+
+        Returns:
+            The response to the command.
+        """
+        try:
+            return self._run_command_json(command_json)
+        except Exception:  # noqa: BLE001  # no matter what, server should forward all kinds of exceptions to the client
+            traceback.print_exc()
+            return self.exception_response()
+
+    def _run_command_json(self, command_json: dict[str, Any]) -> dict[str, Any]:
+        self.release_references(command_json.get("release", []))
         if "function" not in command_json:
-            return self.get_attribute(command)
+            return self._get_attribute_json(command_json)
         target_class = command_json["class"]
         function = command_json["function"]
         args_raw = command_json.get("args", [])
-        args = [self.convert_argument_from_json(arg) for arg in args_raw]
+        args = cast("list[Any]", self.convert_argument_from_json(args_raw))
         kwargs_raw = command_json.get("kwargs", {})
         kwargs = {k: self.convert_argument_from_json(v) for k, v in kwargs_raw.items()}
-        target_function = getattr(self.return_target(target_class), function)
+        key = (target_class, function)
+        target_function = self._method_cache.get(key)
+        if target_function is None:
+            target_function = getattr(self.return_target(target_class), function)
+            self._method_cache[key] = target_function
         result = target_function(*args, **kwargs)
         ret = self.convert_argument_to_json(result)
-        return json.dumps(
-            {
-                "status": "success",
-                "return": ret,
-            },
-        )
-
-    def get_attribute(self, command: str) -> str:
+        return {
+            "status": codec.STATUS_SUCCESS,
+            "return": ret,
+        }
+
+    def get_attribute(self, command: bytes) -> bytes:
         """Get the value of attribute specified in the command.
 
         If the attribute specifies a callable, the function returns that the object is an callable, allowing
         the client to send another request with the desired arguments.
 
         Args:
-            command: JSON representation of the class and attribute to retrieve.
+            command: MessagePack representation of the class and attribute to retrieve.
 
         Returns:
-            The value of the attribute in a JSON string.
+            The value of the attribute in MessagePack format.
         """
-        command_json = json.loads(command)
+        return codec.encode(self._get_attribute_json(codec.decode(command)))
+
+    def _get_attribute_json(self, command_json: dict[str, Any]) -> dict[str, Any]:
         target_class = command_json["class"]
         attribute = command_json["attribute"]
         target_attribute = getattr(self.return_target(target_class), attribute)
         if callable(target_attribute):
-            ret = {
-                "type": "callable",
-                "value": None,
+            return {
+                "status": codec.STATUS_SUCCESS,
+                "callable": True,
             }
-        else:
-            ret = self.convert_argument_to_json(target_attribute)
-        return json.dumps(
-            {
-                "status": "success",
-                "return": ret,
-            },
-        )
+        return {
+            "status": codec.STATUS_SUCCESS,
+            "return": self.convert_argument_to_json(target_attribute),
+        }
+
+    def exception_response(self) -> dict[str, Any]:
+        """Create the response for the client from the exception that is currently being handled.
+
+        Returns:
+            The response containing the exception message and the formatted traceback.
+        """
+        et, ev, tb = sys.exc_info()
+        response = {
+            "status": codec.STATUS_EXCEPTION,
+            "message": repr(ev),
+            "formatted_traceback": traceback.format_exception(et, ev, tb),
+        }
+        if self._full_traceback:
+            response["traceback"] = Traceback(tb).to_dict()
+        return response
 
 
 server: Server | None = None
 
 
+def process_command(server: Server, command: bytes) -> bytes:
+    """Run the command, and turn any exception into a response for the client.
+
+    Args:
+        server: The server that shall run the command.
+        command: The encoded command received from the client.
+
+    Returns:
+        The encoded response for the client.
+    """
+    try:
+        result = server.run_command(command)
+        # the client would drop a larger response, so it is told about the exceeded size instead
+        codec.check_message_size(result)
+    except Exception:  # noqa: BLE001  # no matter what, server should forward all kinds of exceptions
+        traceback.print_exc()
+        return encode_exception_response(server)
+    return result
+
+
+def encode_exception_response(server: Server) -> bytes:
+    """Encode the response for the exception that is currently being handled, so it fits into a message.
+
+    The message of an exception can be arbitrarily long, and it is contained both in the message and the formatted
+    traceback. If the response is too large, both are truncated, and the full traceback is left out.
+
+    Args:
+        server: The server that creates the response.
+
+    Returns:
+        The encoded response for the client.
+    """
+    response = server.exception_response()
+    encoded = codec.encode(response)
+    if len(encoded) <= codec.MAX_MESSAGE_SIZE:
+        return encoded
+    # a character takes at most 4 bytes, so both texts together take at most half of the maximum size
+    max_length = codec.MAX_MESSAGE_SIZE // 16
+    response["message"] = _truncate(response["message"], max_length)
+    response["formatted_traceback"] = [_truncate("".join(response["formatted_traceback"]), max_length)]
+    response.pop("traceback", None)
+    return codec.encode(response)
+
+
+def _truncate(text: str, max_length: int) -> str:
+    """Shorten the text to the given number of characters, noting how much was left out.
+
+    Args:
+        text: The text to shorten.
+        max_length: The maximum number of characters to keep.
+
+    Returns:
+        The shortened text.
+    """
+    if len(text) <= max_length:
+        return text
+    return f"{text[:max_length]}... ({len(text) - max_length} characters truncated)"
+
+
 async def handle_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
-    """Read the command from the client, run it, and return the server response.
+    """Read commands from the client, run them, and return the server responses.
+
+    The connection is kept open and serves any number of commands, until the client closes it.
 
     Args:
         reader: Input Buffer.
         writer: Output Buffer.
-
-    Returns:
-        Response from the server.
     """
     if server is None:
         msg = "Server object was not initialized properly."
         raise RuntimeError(msg)
+    sock = writer.get_extra_info("socket")
+    if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+        # responses shall be sent immediately, and the persistent connection shall detect dead clients
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
     try:
-        data = await reader.readline()
-        if not data:
-            # for pipes handle_request can get called even on a connect, then the string is empty
-            # and nothing should be done
-            return
-        command = data.decode("utf-8")
-        result_string = server.run_command(command)
-        result = result_string.encode("utf-8")
-    except Exception:  # noqa: BLE001  # no matter what, server should forward all kinds of exceptions to the client
-        traceback.print_exc()
-        et, ev, tb = sys.exc_info()
-        message = repr(ev)
-        tb = Traceback(tb).to_dict()
-        result = json.dumps(
-            {
-                "status": "exception",
-                "message": message,
-                "traceback": tb,
-            },
-        ).encode("utf-8")
-    writer.write(result + b"\n")
-    await writer.drain()
+        while True:
+            try:
+                data = await read_frame(reader)
+            except ValueError:
+                # the frame header was invalid, so the following data cannot be interpreted anymore
+                logging.exception("Received an invalid frame from the client, closing the connection")
+                break
+            if data is None:
+                # the client closed the connection (for pipes handle_request can also get called on a connect,
+                # then there is no data at all), and nothing should be done
+                break
+            result = process_command(server, data)
+            # large results shall not be copied only to prepend the header
+            writer.writelines((codec.frame_header(result), result))
+            await writer.drain()
+    except ConnectionError:
+        # the client went away without closing the connection properly, which ends the connection as well
+        logging.info("Lost connection to client")
+    finally:
+        writer.close()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes | None:
+    """Read a single frame from the client.
+
+    Args:
+        reader: Input Buffer.
 
-    writer.close()
+    Returns:
+        The payload of the frame, or None if the connection was closed before a complete frame was received.
+    """
+    try:
+        header = await reader.readexactly(codec.HEADER_SIZE)
+        return await reader.readexactly(codec.frame_length(header))
+    except asyncio.IncompleteReadError:
+        return None
 
 
 async def main_tcp(local_ip: str, local_port: int) -> None:
     """Start a TCP server to handle requests from the client.
 
+    If the environment variable PORT_FILE_VARIABLE is set, the port is written to the file it points to. Together
+    with port 0, this allows the process that started the server to find out which port was chosen.
+
     Args:
         local_ip: IP-Address of the interface to listen on.
-        local_port: Port number to listen on.
+        local_port: Port number to listen on. Use 0 to let the operating system choose a free port.
     """
     tcp_server = await asyncio.start_server(handle_request, local_ip, local_port)
 
     addr = tcp_server.sockets[0].getsockname()
     logging.info(f"Serving on {addr}")
+    port_file = os.environ.get(PORT_FILE_VARIABLE)
+    if port_file:
+        # write to a temporary file first, so the reader never sees an incomplete port number
+        temp_file = Path(f"{port_file}.tmp")
+        temp_file.write_text(str(addr[1]))
+        temp_file.replace(port_file)
 
     async with tcp_server:
         await tcp_server.serve_forever()
 
 
+async def main_unix(path: str) -> None:
+    """Start a local server that is listening on a Unix domain socket.
+
+    Args:
+        path: The file system path of the socket to create and listen on, or a name in the abstract namespace
+            starting with a null byte (Linux only).
+    """
+    if sys.platform == "win32":
+        msg = "Unix domain sockets are not supported on Windows, use named pipes instead."
+        raise RuntimeError(msg)
+    if not path.startswith("\0"):
+        # a socket file left over from a previous server would prevent binding
+        with contextlib.suppress(FileNotFoundError):
+            Path(path).unlink()
+    unix_server = await asyncio.start_unix_server(handle_request, path)
+    logging.info(f"Serving on {path}")
+
+    async with unix_server:
+        await unix_server.serve_forever()
+
+
 async def main_pipe(pipe_name: str) -> None:
     """Start a local server that is listening on a named pipe.
 
@@ -236,32 +421,93 @@ async def main_pipe(pipe_name: str) -> None:
     await _serving_forever_fut
 
 
-def run_server(
+def main_shm(shm_name: str) -> None:
+    """Serve a single client that exchanges messages with the server via shared memory.
+
+    Args:
+        shm_name: The name of the shared memory to create.
+    """
+    if server is None:
+        msg = "Server object was not initialized properly."
+        raise RuntimeError(msg)
+    channel = SharedMemoryChannel(shm_name, create=True)
+    logging.info(f"Serving on shared memory {shm_name}")
+    # the shared memory shall also be destroyed when the process is terminated
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit())
+    try:
+        # the created shared memory is filled with zeros, and a client might already have written its first command
+        sequence = 0
+        while True:
+            sequence = channel.wait(shm.REQUEST_AREA, sequence)
+            result = process_command(server, channel.read(shm.REQUEST_AREA))
+            channel.write(shm.RESPONSE_AREA, result, sequence)
+    finally:
+        channel.close()
+        channel.unlink()
+
+
+def use_libuv_event_loop() -> None:
+    """Use the faster libuv based event loop for asyncio, if it is installed.
+
+    This is winloop on Windows and uvloop on all other platforms. Named pipes are not supported by these loops,
+    so only the socket servers use them.
+    """
+    module_name = "winloop" if sys.platform == "win32" else "uvloop"
+    try:
+        libuv_loop = importlib.import_module(module_name)
+    except ImportError:
+        return
+    logging.info(f"Using {module_name} event loop")
+    asyncio.set_event_loop_policy(libuv_loop.EventLoopPolicy())
+
+
+def run_server(  # noqa: PLR0913  # keyword-only listening options
     served_objects: dict[str, Any],
     *,
     local_ip: str = "",
     local_port: int = -1,
     pipe_name: str = "",
+    unix_path: str = "",
+    use_abstract: bool = sys.platform == "linux",
+    shm_name: str = "",
+    full_traceback: bool = False,
 ) -> None:
-    """Start serving the passed objects via TCP or named pipes.
+    """Start serving the passed objects via TCP, named pipes, Unix domain sockets, or shared memory.
 
     Args:
         served_objects: Dictionary of the names and objects to serve.
         local_ip: IP address of the interface to listen on. Required for TCP Server.
         local_port: Port number to listen on. Required for TCP Server.
-        pipe_name: Name of the named pipe to communicate with the client. Required for Pipe Server.
+        pipe_name: Name of the named pipe to communicate with the client. Required for Pipe Server. Outside of
+            Windows, a Unix domain socket named after the pipe is used instead.
+        unix_path: File system path of the Unix domain socket to listen on. Required for Unix Socket Server.
+        use_abstract: Create the Unix domain socket of a Pipe Server in the abstract namespace. Only supported on
+            Linux, where it is the default.
+        shm_name: Name of the shared memory to create for a single client. Required for Shared Memory Server.
+        full_traceback: Send tracebacks that the client can rebuild as traceback objects. Requires tblib.
     """
     global server  # noqa: PLW0603
     if server is not None:
         msg = "The server cannot be run more than once."
         raise RuntimeError(msg)
-    server = Server(served_objects)
+    server = Server(served_objects, full_traceback=full_traceback)
     if local_ip:
+        use_libuv_event_loop()
         coro = main_tcp(local_ip, local_port)
-    elif pipe_name:
+    elif pipe_name and sys.platform == "win32":
         loop = asyncio.ProactorEventLoop()
         asyncio.set_event_loop(loop)
         coro = main_pipe(pipe_name)
+    elif pipe_name:
+        use_libuv_event_loop()
+        coro = main_unix(pipe_socket_path(pipe_name, use_abstract=use_abstract))
+    elif shm_name:
+        # polling the shared memory does not need an event loop
+        main_shm(shm_name)
+        return
+    elif unix_path:
+        use_libuv_event_loop()
+        coro = main_unix(unix_path)
     else:
         msg = "Did not specify any address on which to listen."
         raise ValueError(msg)
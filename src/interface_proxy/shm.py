@@ -0,0 +1,160 @@
+"""Shared memory channel, where client and server exchange messages without any system call.
+
+The shared memory consists of a request and a response area, each with a sequence number, the length of the message,
+and the message itself. The writer of an area first copies the message and then increments the sequence number,
+which is polled by the reader. As the standard library has no notification mechanism between unrelated processes,
+the reader spins for a short time and then sleeps, so an idle channel only costs little CPU time.
+Only a single client can use a channel at a time, as there is only one request area.
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+
+from interface_proxy import codec
+
+_sequence = struct.Struct("<Q")
+_length = struct.Struct("<I")
+
+AREA_HEADER_SIZE = 16
+"""Number of bytes before the message in each area, which contain the sequence number and the message length."""
+
+CAPACITY = codec.MAX_MESSAGE_SIZE
+"""Maximum number of bytes of a message in each area."""
+
+REQUEST_AREA = 0
+"""Offset of the area to which the client writes its commands."""
+
+RESPONSE_AREA = AREA_HEADER_SIZE + CAPACITY
+"""Offset of the area to which the server writes its responses."""
+
+SIZE = 2 * (AREA_HEADER_SIZE + CAPACITY)
+"""Total number of bytes of the shared memory. Pages that are not used are usually never allocated."""
+
+SPIN_TIME = 2e-4
+"""Time in seconds to poll without sleeping after waiting started, which covers calls in quick succession."""
+
+MAX_SLEEP = 1e-3
+"""Maximum time in seconds to sleep between polls, which limits the latency of a call to an idle channel."""
+
+
+class SharedMemoryChannel:
+    """A request and a response area in shared memory, that connect a client with a server."""
+
+    def __init__(self, name: str, *, create: bool = False) -> None:
+        """Create or attach the shared memory.
+
+        Args:
+            name: The name of the shared memory, which must be the same for client and server.
+            create: Create the shared memory, which is done by the server. Otherwise, the existing shared memory is
+                attached, and FileNotFoundError is raised if it does not exist yet.
+        """
+        if create:
+            self._memory = self._create(name)
+        else:
+            self._memory = shared_memory.SharedMemory(name)
+            if os.name == "posix":
+                # the resource tracker would destroy the shared memory when the client exits, but the server owns it
+                from multiprocessing import resource_tracker
+
+                resource_tracker.unregister(f"/{self._memory.name}", "shared_memory")
+        self._buf = self._memory.buf
+
+    @staticmethod
+    def _create(name: str) -> shared_memory.SharedMemory:
+        """Create the shared memory, and replace a stale one that was left behind by a killed server.
+
+        Args:
+            name: The name of the shared memory.
+
+        Returns:
+            The created shared memory.
+        """
+        try:
+            return shared_memory.SharedMemory(name, create=True, size=SIZE)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            return shared_memory.SharedMemory(name, create=True, size=SIZE)
+
+    def close(self) -> None:
+        """Detach from the shared memory."""
+        self._buf.release()
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """Destroy the shared memory, which is done by the server when it stops."""
+        self._memory.unlink()
+
+    def sequence(self, area: int) -> int:
+        """Get the sequence number of the last message written to the area.
+
+        Args:
+            area: The offset of the area.
+
+        Returns:
+            The sequence number.
+        """
+        return int(_sequence.unpack_from(self._buf, area)[0])
+
+    def write(self, area: int, payload: bytes, sequence: int) -> None:
+        """Write a message to the area, and then publish it with the given sequence number.
+
+        Args:
+            area: The offset of the area.
+            payload: The encoded message.
+            sequence: The new sequence number of the area.
+
+        Raises:
+            ValueError: The message is larger than the capacity of the area.
+        """
+        codec.check_message_size(payload)
+        length = len(payload)
+        start = area + AREA_HEADER_SIZE
+        self._buf[start : start + length] = payload
+        _length.pack_into(self._buf, area + _sequence.size, length)
+        # the sequence number is written last, so the reader only sees complete messages
+        _sequence.pack_into(self._buf, area, sequence)
+
+    def read(self, area: int) -> bytes:
+        """Read the last message written to the area.
+
+        Args:
+            area: The offset of the area.
+
+        Returns:
+            The encoded message.
+        """
+        (length,) = _length.unpack_from(self._buf, area + _sequence.size)
+        start = area + AREA_HEADER_SIZE
+        return bytes(self._buf[start : start + length])
+
+    def wait(self, area: int, previous: int, timeout: float | None = None) -> int:
+        """Wait until a new message was written to the area.
+
+        Args:
+            area: The offset of the area.
+            previous: The sequence number of the last message that was read from the area.
+            timeout: Maximum time in seconds to wait, or None to wait forever.
+
+        Returns:
+            The sequence number of the new message.
+        """
+        start = time.perf_counter()
+        delay = 1e-5
+        while True:
+            sequence = self.sequence(area)
+            if sequence != previous:
+                return sequence
+            elapsed = time.perf_counter() - start
+            if elapsed < SPIN_TIME:
+                continue
+            if timeout is not None and elapsed > timeout:
+                msg = "No message was received within the timeout."
+                raise TimeoutError(msg)
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_SLEEP)
@@ -0,0 +1,49 @@
+"""Fixtures that start each server once per test session, so all test classes of a protocol can share it."""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from interface_proxy.client import RunServer
+
+
+def serve(server_py: str) -> Iterator[RunServer]:
+    """Start the server script and terminate it when the fixture is torn down.
+
+    Args:
+        server_py: The file name of the server script in the directory of the integration tests.
+
+    Yields:
+        The RunServer managing the server process.
+    """
+    caller = object()
+    rs = RunServer(caller, server_py=Path(__file__).parent / server_py)
+    yield rs
+    rs.release(caller)
+
+
+@pytest.fixture(scope="session")
+def pipe_server() -> Iterator[RunServer]:
+    """Run the server listening on a named pipe."""
+    yield from serve("server_app_pipe.py")
+
+
+@pytest.fixture(scope="session")
+def tcp_server() -> Iterator[RunServer]:
+    """Run the server listening on a local port."""
+    yield from serve("server_app_tcp.py")
+
+
+@pytest.fixture(scope="session")
+def uds_server() -> Iterator[RunServer]:
+    """Run the server listening on a Unix domain socket."""
+    yield from serve("server_app_uds.py")
+
+
+@pytest.fixture(scope="session")
+def shm_server() -> Iterator[RunServer]:
+    """Run the server communicating via shared memory."""
+    yield from serve("server_app_shm.py")
@@ -0,0 +1,7 @@
+"""Run the server communicating via shared memory."""
+
+from server_app import served_objects
+
+from interface_proxy.server import run_server
+
+run_server(served_objects, shm_name="interface-proxy-test-shm")
@@ -0,0 +1,10 @@
+"""Run the server listening on a Unix domain socket."""
+
+import tempfile
+from pathlib import Path
+
+from server_app import served_objects
+
+from interface_proxy.server import run_server
+
+run_server(served_objects, unix_path=str(Path(tempfile.gettempdir()) / "interface-proxy-test.sock"))
@@ -1,5 +1,7 @@
 """Dummy library with class and functions used by the test server."""
 
+import weakref
+
 
 class ComplicatedObject:
     """A simple class."""
@@ -15,9 +17,19 @@ class ComplicatedObject:
         return self.var
 
 
+_created_objects: "weakref.WeakSet[ComplicatedObject]" = weakref.WeakSet()
+
+
 def create_complicated_object() -> ComplicatedObject:
     """Wrapper function to create and return an object."""
-    return ComplicatedObject()
+    co = ComplicatedObject()
+    _created_objects.add(co)
+    return co
+
+
+def count_complicated_objects() -> int:
+    """Count the created objects that are still alive, i.e. not yet released by the server."""
+    return len(_created_objects)
 
 
 def set_co(co: ComplicatedObject, v: int) -> None:
@@ -38,3 +50,13 @@ def do_something(action: str) -> None:
 def get_double(number: int) -> int:
     """Simulate a transformation on the server (calculate the double)."""
     return number * 2
+
+
+def create_bytes(size: int) -> bytes:
+    """Simulate a large result on the server."""
+    return b"x" * size
+
+
+def fail(message: str) -> None:
+    """Simulate a function that fails on the server."""
+    raise ValueError(message)
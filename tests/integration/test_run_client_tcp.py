@@ -1,61 +1,278 @@
 """Test that starts a server for different protocols and initializes the proxies, where the tests are run."""
 
+import gc
 import logging
+import os
 import sys
+import tempfile
+import weakref
 from pathlib import Path
-from typing import Any
+from typing import Protocol, cast
 
-from interface_proxy.client import PipeProxy, RunServer, TCPProxy
+import pytest
 
-logging.basicConfig(stream=sys.stdout)
-# remove for production use:
-logging.getLogger("InterfaceProxyClient").setLevel(logging.INFO)
+from interface_proxy import codec
+from interface_proxy.client import (
+    Batch,
+    BatchResult,
+    PipeProxy,
+    Proxy,
+    RemoteError,
+    RemoteVar,
+    RunServer,
+    ShmProxy,
+    TCPProxy,
+    UnixSocketProxy,
+    connect_shm,
+    connect_tcp,
+    connect_unix,
+)
 
+# set INTERFACE_PROXY_LOG to a level like DEBUG to see the communication, it slows down every call otherwise
+log_level = os.getenv("INTERFACE_PROXY_LOG")
+if log_level:
+    logging.basicConfig(stream=sys.stdout)
+    logging.getLogger("InterfaceProxyClient").setLevel(log_level)
 
-class BaseTestClientServerCommunication:
-    """Base class defining test cases independent of communication protocol."""
 
-    t: Any
-    p: Any
+class TargetClassProto(Protocol):
+    """The functions of the test library, as they can be called via the proxy."""
+
+    def do_something(self, action: str) -> None:
+        """Simulate to do something on the server (like print)."""
+
+    def get_double(self, number: int) -> int:
+        """Simulate a transformation on the server (calculate the double)."""
+
+    def create_complicated_object(self) -> RemoteVar:
+        """Create an object on the server and return a reference to it."""
+
+    def set_co(self, co: RemoteVar, v: int) -> None:
+        """Set variable on the referenced object."""
+
+    def get_co(self, co: RemoteVar) -> int:
+        """Get variable from the referenced object."""
+
+    def count_complicated_objects(self) -> int:
+        """Count the objects that are still alive on the server."""
+
+    def create_bytes(self, size: int) -> bytes:
+        """Simulate a large result on the server."""
+
+    def fail(self, message: str) -> None:
+        """Simulate a function that fails on the server."""
+
+
+class BatchedTargetClassProto(Protocol):
+    """The functions of the test library while a Batch is active, where the results are only available later."""
+
+    def get_double(self, number: int) -> BatchResult:
+        """Queue the calculation of the double."""
+
+    def set_co(self, co: RemoteVar, v: int) -> BatchResult:
+        """Queue setting the variable on the referenced object."""
+
+    def get_co(self, co: RemoteVar) -> BatchResult:
+        """Queue getting the variable from the referenced object."""
+
+    def fail(self, message: str) -> BatchResult:
+        """Queue a function that fails on the server."""
+
+
+class ParamProto(Protocol):
+    """The constants of the test parameters, as they can be read via the proxy."""
+
+    PARAM1: int
+    PARAM2: int
+
+
+not_windows = pytest.mark.skipif(sys.platform == "win32", reason="Unix domain sockets are not available on Windows")
+
+
+def pipe_proxies(_rs: RunServer) -> tuple[Proxy, Proxy]:
+    """Create the Proxy objects for the Pipe server."""
+    return PipeProxy("TargetClass", "interface-proxy-test-pipe"), PipeProxy("Param", "interface-proxy-test-pipe")
+
+
+def tcp_proxies(rs: RunServer) -> tuple[Proxy, Proxy]:
+    """Create the Proxy objects for the TCP server, which share a single connection."""
+    conn = connect_tcp("127.0.0.1", rs.port)
+    return TCPProxy("TargetClass", conn=conn), TCPProxy("Param", conn=conn)
+
+
+def uds_proxies(_rs: RunServer) -> tuple[Proxy, Proxy]:
+    """Create the Proxy objects for the Unix domain socket server, which share a single connection."""
+    conn = connect_unix(str(Path(tempfile.gettempdir()) / "interface-proxy-test.sock"))
+    return UnixSocketProxy("TargetClass", conn=conn), UnixSocketProxy("Param", conn=conn)
+
+
+def shm_proxies(_rs: RunServer) -> tuple[Proxy, Proxy]:
+    """Create the Proxy objects for the shared memory server, which must share a single connection."""
+    conn = connect_shm("interface-proxy-test-shm")
+    return ShmProxy("TargetClass", conn=conn), ShmProxy("Param", conn=conn)
+
+
+@pytest.fixture(scope="class")
+def _proxies(request: pytest.FixtureRequest) -> None:
+    """Get the shared server for the protocol of the test, and create the Proxy objects for the test class."""
+    proxy_factory, server_fixture = request.param
+    rs = request.getfixturevalue(server_fixture)
+    request.cls.rs = rs
+    request.cls.t, request.cls.p = proxy_factory(rs)
+
+
+@pytest.mark.parametrize(
+    "_proxies",
+    [
+        pytest.param((pipe_proxies, "pipe_server"), id="pipe"),
+        pytest.param((tcp_proxies, "tcp_server"), id="tcp"),
+        pytest.param((uds_proxies, "uds_server"), id="uds", marks=not_windows),
+        pytest.param((shm_proxies, "shm_server"), id="shm"),
+    ],
+    indirect=True,
+    scope="class",
+)
+@pytest.mark.usefixtures("_proxies")
+class TestClientServerCommunication:
+    """Test cases independent of communication protocol, which are run for each protocol."""
+
+    t: TargetClassProto
+    p: ParamProto
     rs: RunServer
 
+    # set INTERFACE_PROXY_BENCH to measure the communication only, without serializing the arguments for each call
+    bench = bool(os.getenv("INTERFACE_PROXY_BENCH"))
+    ARGS_WONDER = codec.encode_args("wonder")
+    ARGS_21 = codec.encode_args(21)
+
     def test_call(self) -> None:
         """Just call a method that executes something on the server."""
-        self.t.do_something("wonder")
+        if self.bench:
+            cast(Proxy, self.t)._invoke_preencoded("do_something", self.ARGS_WONDER)
+        else:
+            self.t.do_something("wonder")
 
     def test_doubling(self) -> None:
         """Call a function on the server that takes an argument, transforms it, and returns the result."""
-        assert self.t.get_double(21) == 42
+        if self.bench:
+            assert cast(Proxy, self.t)._invoke_preencoded("get_double", self.ARGS_21) == 42
+        else:
+            assert self.t.get_double(21) == 42
+
+    def test_preencoded(self) -> None:
+        """Call a function with arguments serialized in advance, which also sends the pending releases."""
+        proxy = cast(Proxy, self.t)
+        obj = self.t.create_complicated_object()
+        count = self.t.count_complicated_objects()
+        del obj
+        assert proxy._invoke_preencoded("get_double", codec.encode_args(21)) == 42
+        assert self.t.count_complicated_objects() == count - 1
+
+    def test_preencoded_in_batch(self) -> None:
+        """Calls with arguments serialized in advance cannot be queued."""
+        proxy = cast(Proxy, self.t)
+        with Batch(proxy), pytest.raises(RuntimeError, match="cannot be queued"):
+            proxy._invoke_preencoded("get_double", self.ARGS_21)
+
+    def test_big_int(self) -> None:
+        """Integers that do not fit into 64 bits are transferred as well."""
+        assert self.t.get_double(2**70) == 2**71
+        assert self.t.get_double(-(2**64)) == -(2**65)
 
     def test_two_objects(self) -> None:
         """Create objects on the server, and work with them without interference."""
         obj1 = self.t.create_complicated_object()
         obj2 = self.t.create_complicated_object()
-        self.t.set_co(obj1, 42)
-        self.t.set_co(obj2, self.p.PARAM1)
+        with Batch(self.t):
+            self.t.set_co(obj1, 42)
+            self.t.set_co(obj2, self.p.PARAM1)
         assert self.t.get_co(obj1) == 42
         assert self.t.get_co(obj2) == 4  # PARAM1
 
-    def teardown_class(self) -> None:
-        """Let the RunServer know that the server process can be terminated."""
-        self.rs.release(self)
+    def test_batch(self) -> None:
+        """Send several function calls to the server in a single request."""
+        obj = self.t.create_complicated_object()
+        batched = cast(BatchedTargetClassProto, self.t)
+        with Batch(batched):
+            set_result = batched.set_co(obj, 21)
+            double_result = batched.get_double(self.p.PARAM1)
+            get_result = batched.get_co(obj)
+        assert set_result.result() is None
+        assert double_result.result() == 8
+        assert get_result.result() == 21
+
+    def test_remote_error(self) -> None:
+        """An exception on the server is raised as RemoteError, which contains the original exception."""
+        with pytest.raises(RemoteError, match=r"failed with ValueError\('broken'\)"):
+            self.t.fail("broken")
+        assert self.t.get_double(21) == 42
+
+    def test_remote_error_in_batch(self) -> None:
+        """An exception on the server is raised when getting the result, without affecting the other calls."""
+        batched = cast(BatchedTargetClassProto, self.t)
+        with Batch(batched):
+            fail_result = batched.fail("broken")
+            double_result = batched.get_double(2)
+        with pytest.raises(RemoteError, match=r"failed with ValueError\('broken'\)"):
+            fail_result.result()
+        assert double_result.result() == 4
+
+    def test_release(self) -> None:
+        """Objects on the server are released once the client no longer references them."""
+        obj = self.t.create_complicated_object()
+        count = self.t.count_complicated_objects()
+        del obj
+        # the release is sent along with the next command
+        assert self.t.count_complicated_objects() == count - 1
 
+    def test_release_in_failed_batch(self) -> None:
+        """Releases are not lost when a batch is discarded due to an exception."""
+        obj = self.t.create_complicated_object()
+        count = self.t.count_complicated_objects()
+        with pytest.raises(KeyError), Batch(self.t):  # noqa: PT012  # the exception must occur inside the batch
+            self.t.get_double(1)
+            del obj
+            self.t.get_double(2)
+            raise KeyError
+        assert self.t.count_complicated_objects() == count - 1
 
-class TestClientServerCommunicationPipe(BaseTestClientServerCommunication):
-    """Test implementation for Pipe Proxy."""
+    def test_command_size_limit(self) -> None:
+        """A command that exceeds the maximum message size is rejected without affecting further calls."""
+        with pytest.raises(ValueError, match="exceeds the maximum size"):
+            self.t.do_something("x" * codec.MAX_MESSAGE_SIZE)
+        assert self.t.get_double(21) == 42
+
+    def test_exception_size_limit(self) -> None:
+        """An exception with a message too large for a response is still reported, with a truncated message."""
+        with pytest.raises(RemoteError, match="characters truncated"):
+            self.t.fail("x" * (codec.MAX_MESSAGE_SIZE // 2))
+        assert self.t.get_double(21) == 42
+
+    def test_result_size_limit(self) -> None:
+        """A result that exceeds the maximum message size is reported by the server without affecting further calls."""
+        with pytest.raises(RemoteError, match="exceeds the maximum size"):
+            self.t.create_bytes(codec.MAX_MESSAGE_SIZE)
+        assert self.t.get_double(21) == 42
 
-    def setup_class(self) -> None:
-        """Start the Pipe server and create Proxy objects for the tests."""
-        self.rs = RunServer(self, server_py=Path(__file__).parent / "server_app_pipe.py")
-        self.t = PipeProxy("TargetClass", "interface-proxy-test-pipe")
-        self.p = PipeProxy("Param", "interface-proxy-test-pipe")
 
+@not_windows
+def test_reconnect_after_restart(uds_server: RunServer) -> None:
+    """A shared connection is opened again, if the server was restarted since the previous call."""
+    conn = connect_unix(str(Path(tempfile.gettempdir()) / "interface-proxy-test.sock"))
+    t = cast(TargetClassProto, UnixSocketProxy("TargetClass", conn=conn))
+    assert t.get_double(1) == 2
+    uds_server.run_server()
+    assert t.get_double(2) == 4
 
-class TestClientServerCommunicationTCP(BaseTestClientServerCommunication):
-    """Test implementation for TCP Proxy."""
 
-    def setup_class(self) -> None:
-        """Start the TCP server and create Proxy objects for the tests."""
-        self.rs = RunServer(self, server_py=Path(__file__).parent / "server_app_tcp.py")
-        self.t = TCPProxy("TargetClass", "127.0.0.1", 8888)
-        self.p = TCPProxy("Param", "127.0.0.1", 8888)
+def test_dropped_proxy_is_freed(tcp_server: RunServer) -> None:
+    """A proxy with cached functions is freed without the garbage collector, which also closes its connection."""
+    t = TCPProxy("TargetClass", "127.0.0.1", tcp_server.port)
+    assert cast(TargetClassProto, t).get_double(1) == 2
+    proxy_ref = weakref.ref(t)
+    gc.disable()
+    try:
+        del t
+        assert proxy_ref() is None
+    finally:
+        gc.enable()